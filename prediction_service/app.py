@@ -3,55 +3,203 @@ Flask API Server for ARIMA Suspension Predictions
 Provides REST endpoints for the frontend to fetch predictions
 """
 
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request, stream_with_context
 from flask_cors import CORS
 from arima_model import SuspensionPredictor
+from training_queue import TrainingQueue, TrainingQueueFull
+from locations import get_municipalities
+from profiling import ProfileStore, profile_block
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, wait
+import hmac
 import json
+import random
+import threading
+import time
 from datetime import datetime
 import os
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for React frontend
 
-# Global predictor instance (cache)
-predictor_cache = {}
+# Admission control limits (override via environment)
+MAX_CACHED_CITIES = int(os.environ.get('PREDICTION_MAX_CACHED_CITIES', 50))
+MAX_CONCURRENT_FITS = int(os.environ.get('PREDICTION_MAX_CONCURRENT_FITS', 2))
+MAX_QUEUED_FITS = int(os.environ.get('PREDICTION_MAX_QUEUED_FITS', 8))
+MAX_SIMULATION_PATHS = int(os.environ.get('PREDICTION_MAX_SIMULATION_PATHS', 20000))
+MAX_SIMULATION_DAYS = int(os.environ.get('PREDICTION_MAX_SIMULATION_DAYS', 30))
+# Requested path counts are rounded up to one of these so the simulation cache hits
+SIMULATION_PATH_SIZES = tuple(
+    n for n in (1000, 5000, 10000, 20000) if n <= MAX_SIMULATION_PATHS
+) or (MAX_SIMULATION_PATHS,)
+
+# Profiling (disabled unless a token is configured)
+PROFILING_TOKEN = os.environ.get('PREDICTION_PROFILING_TOKEN')
+PROFILE_SAMPLE_RATE = float(os.environ.get('PREDICTION_PROFILE_SAMPLE_RATE', 0))
+PROFILE_WINDOW_SECONDS = int(os.environ.get('PREDICTION_PROFILE_WINDOW_SECONDS', 3600))
+
+# Global predictor instance (cache), least recently used first
+predictor_cache = OrderedDict()
 last_training_time = {}
+cache_lock = threading.Lock()
 
+training_queue = TrainingQueue(
+    max_concurrent=MAX_CONCURRENT_FITS,
+    max_pending=MAX_QUEUED_FITS
+)
 
-def get_or_train_predictor(city='Batangas City', force_retrain=False):
+profile_store = ProfileStore(window_seconds=PROFILE_WINDOW_SECONDS)
+
+
+def profiling_requested():
     """
-    Get cached predictor or train a new one
-    Retrains every 6 hours or if forced
+    True if the request carries a valid X-Profile-Token header
     """
-    cache_key = city
-    current_time = datetime.now()
+    if not PROFILING_TOKEN:
+        return False
+    token = request.headers.get('X-Profile-Token', '')
+    # Compare bytes: compare_digest rejects non-ASCII str, which headers may contain
+    return hmac.compare_digest(token.encode('utf-8'), PROFILING_TOKEN.encode('utf-8'))
 
-    # Check if we need to retrain
-    needs_training = (
-        force_retrain or
-        cache_key not in predictor_cache or
-        cache_key not in last_training_time or
-        (current_time - last_training_time[cache_key]).total_seconds() > 6 * 3600
-    )
 
-    if needs_training:
-        print(f"[*] Training new model for {city}...")
-        predictor = SuspensionPredictor()
+def _train_and_cache(city, profile=False, evict=True):
+    """
+    Run the full pipeline for a city and store the result in the cache
+    Evicts least recently used cities beyond MAX_CACHED_CITIES
+
+    With evict=False the result is only cached if there is spare capacity
+    (or the city is already cached), so bulk jobs cannot push out hot cities
+
+    Stage timings of every fit go to profile_store; the fit also runs under
+    cProfile if profile is set or it is picked by PROFILE_SAMPLE_RATE
+    """
+    print(f"[*] Training new model for {city}...")
+    trained_at = datetime.now()
+    predictor = SuspensionPredictor()
+
+    if profile or random.random() < PROFILE_SAMPLE_RATE:
+        with profile_block() as run:
+            result = predictor.run_full_pipeline(city=city, days=90, forecast_steps=7)
+        seconds, functions = run['seconds'], run['functions']
+    else:
+        start = time.perf_counter()
         result = predictor.run_full_pipeline(city=city, days=90, forecast_steps=7)
+        seconds, functions = time.perf_counter() - start, None
 
-        if result:
-            predictor_cache[cache_key] = {
-                'predictor': predictor,
-                'result': result
-            }
-            last_training_time[cache_key] = current_time
-            print(f"[OK] Model cached for {city}")
-        else:
+    profile_store.record('fit', city, seconds, predictor.stage_timings, functions)
+
+    if not result:
+        return None
+
+    cached_data = {
+        'predictor': predictor,
+        'result': result,
+        'training_profile': {
+            'trained_at': trained_at.isoformat(),
+            'seconds': seconds,
+            'stages': dict(predictor.stage_timings),
+            'functions': functions
+        }
+    }
+
+    with cache_lock:
+        if not evict and city not in predictor_cache and len(predictor_cache) >= MAX_CACHED_CITIES:
+            print(f"[*] Cache full, not caching model for {city}")
+            return cached_data
+
+        predictor_cache[city] = cached_data
+        predictor_cache.move_to_end(city)
+        last_training_time[city] = trained_at
+
+        while len(predictor_cache) > MAX_CACHED_CITIES:
+            evicted, _ = predictor_cache.popitem(last=False)
+            last_training_time.pop(evicted, None)
+            print(f"[*] Evicted cached model for {evicted}")
+
+    print(f"[OK] Model cached for {city}")
+    return cached_data
+
+
+def get_cached_predictor(city):
+    """
+    Return the cached predictor for a city if it is less than 6 hours old
+    """
+    cache_key = city
+    current_time = datetime.now()
+
+    with cache_lock:
+        # Check if we need to retrain
+        needs_training = (
+            cache_key not in predictor_cache or
+            cache_key not in last_training_time or
+            (current_time - last_training_time[cache_key]).total_seconds() > 6 * 3600
+        )
+
+        if needs_training:
             return None
-    else:
-        print(f"[OK] Using cached model for {city}")
 
-    return predictor_cache[cache_key]
+        predictor_cache.move_to_end(cache_key)
+        return predictor_cache[cache_key]
+
+
+def get_or_train_predictor(city='Batangas City', force_retrain=False, profile=False):
+    """
+    Get cached predictor or train a new one
+    Retrains every 6 hours or if forced
+
+    Training goes through the bounded training queue: concurrent requests
+    for the same city share one fit, and TrainingQueueFull is raised when
+    no slot is available. A shared fit is only profiled if the request that
+    started it asked for profiling.
+    """
+    if not force_retrain:
+        cached_data = get_cached_predictor(city)
+        if cached_data is not None:
+            print(f"[OK] Using cached model for {city}")
+            return cached_data
+
+    future = training_queue.submit(city, _train_and_cache, city, profile=profile)
+    return future.result()
+
+
+def format_forecast_result(city, result, days=7):
+    """
+    Build the JSON-ready forecast payload for a city from a pipeline result
+    """
+    # Format dates for JSON
+    forecast = result['forecast']
+    for item in forecast:
+        if isinstance(item['date'], datetime):
+            item['date'] = item['date'].strftime('%Y-%m-%d')
+
+    recommendation = result['recommendation']
+    if 'high_risk_days' in recommendation:
+        for day in recommendation['high_risk_days']:
+            if 'date' in day and isinstance(day['date'], datetime):
+                day['date'] = day['date'].strftime('%Y-%m-%d')
+
+    return {
+        'city': city,
+        'forecast': forecast[:days],  # Limit to requested days
+        'recommendation': recommendation,
+        'accuracy': result.get('accuracy'),
+        'model_info': result.get('model_info'),
+        'generated_at': datetime.now().isoformat()
+    }
+
+
+def queue_full_response(error):
+    """
+    Build a 429 response telling the client when to retry
+    """
+    response = jsonify({
+        'error': 'Training queue is full',
+        'message': 'Too many models are being trained right now, please retry later',
+        'retry_after': error.retry_after
+    })
+    response.status_code = 429
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
 
 
 @app.route('/health', methods=['GET'])
@@ -76,6 +224,9 @@ def get_suspension_forecast():
     - days: Number of days to forecast (default: 7)
     - force_retrain: Force model retraining (default: false)
 
+    Headers:
+    - X-Profile-Token: Include a "profile" section (requires PREDICTION_PROFILING_TOKEN)
+
     Returns:
     {
       "city": "Batangas City",
@@ -110,9 +261,11 @@ def get_suspension_forecast():
         city = request.args.get('city', 'Batangas City')
         days = int(request.args.get('days', 7))
         force_retrain = request.args.get('force_retrain', 'false').lower() == 'true'
+        profiling = profiling_requested()
+        start = time.perf_counter()
 
         # Get or train predictor
-        cached_data = get_or_train_predictor(city, force_retrain)
+        cached_data = get_or_train_predictor(city, force_retrain, profile=profiling)
 
         if cached_data is None:
             return jsonify({
@@ -120,36 +273,248 @@ def get_suspension_forecast():
                 'message': 'Unable to generate predictions at this time'
             }), 500
 
-        result = cached_data['result']
+        response = format_forecast_result(city, cached_data['result'], days)
+
+        request_seconds = time.perf_counter() - start
+        profile_store.record('suspension-forecast', city, request_seconds)
+        if profiling:
+            response['profile'] = {
+                'request_seconds': request_seconds,
+                'training': cached_data.get('training_profile')
+            }
+
+        return jsonify(response)
+
+    except TrainingQueueFull as e:
+        return queue_full_response(e)
+    except Exception as e:
+        print(f"❌ Error in suspension_forecast: {e}")
+        return jsonify({
+            'error': str(e),
+            'message': 'Error generating forecast'
+        }), 500
+
+
+def _stream_province_forecasts(municipalities, days):
+    """
+    Yield one NDJSON line per municipality
+
+    Cached cities are emitted first. The rest are trained through the shared
+    training queue, at most MAX_CONCURRENT_FITS at a time for this stream,
+    and emitted in completion order. Only in-flight futures are held, so
+    memory does not grow with the number of municipalities.
+
+    Streamed fits never evict other cities: they are cached only while the
+    cache has spare capacity.
+
+    Municipalities with the same name in different provinces share one model
+    (the cache is keyed by city name), so each in-flight future keeps a list
+    of every (province, city) waiting on it.
+    """
+    def line(payload):
+        return app.json.dumps(payload) + '\n'
+
+    # Pass 1: everything already cached
+    to_train = []
+    for province, municipality in municipalities:
+        city = municipality.title()
+        cached_data = get_cached_predictor(city)
+        if cached_data is None:
+            to_train.append((province, city))
+            continue
+
+        payload = format_forecast_result(city, cached_data['result'], days)
+        payload.update({'province': province, 'status': 'ok', 'source': 'cache'})
+        yield line(payload)
+
+    # Pass 2: train the rest with a bounded window of in-flight fits
+    in_flight = {}
+
+    def drain(return_when):
+        done, _ = wait(in_flight, return_when=return_when)
+        for future in done:
+            requesters = in_flight.pop(future)
+            try:
+                cached_data = future.result()
+            except Exception as e:
+                cached_data = None
+                print(f"❌ Error training {requesters[0][1]}: {e}")
+
+            for province, city in requesters:
+                if cached_data is None:
+                    yield line({
+                        'city': city,
+                        'province': province,
+                        'status': 'error',
+                        'message': 'Failed to train model'
+                    })
+                    continue
+
+                payload = format_forecast_result(city, cached_data['result'], days)
+                payload.update({'province': province, 'status': 'ok', 'source': 'trained'})
+                yield line(payload)
+
+    for province, city in to_train:
+        while len(in_flight) >= MAX_CONCURRENT_FITS:
+            yield from drain(FIRST_COMPLETED)
+
+        while True:
+            try:
+                future = training_queue.submit(city, _train_and_cache, city, evict=False)
+                in_flight.setdefault(future, []).append((province, city))
+                break
+            except TrainingQueueFull as e:
+                if not in_flight:
+                    # Queue is full of other clients' work; report and move on
+                    yield line({
+                        'city': city,
+                        'province': province,
+                        'status': 'busy',
+                        'retry_after': e.retry_after
+                    })
+                    break
+                yield from drain(FIRST_COMPLETED)
+
+    while in_flight:
+        yield from drain(FIRST_COMPLETED)
+
+
+@app.route('/api/predictions/province-forecast', methods=['GET'])
+def stream_province_forecast():
+    """
+    Stream forecasts for every municipality in a province or region as NDJSON
+
+    Query Parameters:
+    - province: Province name, e.g. 'BATANGAS'
+    - region: Region code or name, e.g. '4A' or 'REGION IV-A' (if no province)
+    - days: Number of days to forecast (default: 7)
+
+    Returns (one JSON object per line):
+    {"city": "Batangas City", "province": "BATANGAS", "status": "ok", "source": "cache", "forecast": [...], ...}
+    {"city": "Lipa City", "province": "BATANGAS", "status": "ok", "source": "trained", "forecast": [...], ...}
+    {"city": "Lobo", "province": "BATANGAS", "status": "busy", "retry_after": 12}
+    """
+    try:
+        province = request.args.get('province')
+        region = request.args.get('region')
+        days = int(request.args.get('days', 7))
 
-        # Format dates for JSON
-        forecast = result['forecast']
-        for item in forecast:
+        if not province and not region:
+            return jsonify({
+                'error': 'Missing parameter',
+                'message': 'Provide a province or region'
+            }), 400
+
+        municipalities = get_municipalities(province=province, region=region)
+        if municipalities is None:
+            return jsonify({
+                'error': 'Unknown location',
+                'message': f'No municipalities found for {province or region}'
+            }), 404
+
+        return Response(
+            stream_with_context(_stream_province_forecasts(municipalities, days)),
+            mimetype='application/x-ndjson'
+        )
+
+    except Exception as e:
+        print(f"❌ Error in province_forecast: {e}")
+        return jsonify({
+            'error': str(e),
+            'message': 'Error generating province forecast'
+        }), 500
+
+
+@app.route('/api/predictions/suspension-simulation', methods=['GET'])
+def get_suspension_simulation():
+    """
+    Get Monte Carlo suspension probabilities from simulated future paths
+
+    Query Parameters:
+    - city: City name (default: 'Batangas City')
+    - days: Number of days to simulate (default: 7, max: MAX_SIMULATION_DAYS)
+    - paths: Number of simulated paths (default: 5000), rounded up to one of
+      SIMULATION_PATH_SIZES
+
+    Returns:
+    {
+      "city": "Batangas City",
+      "forecast": [
+        {
+          "date": "2025-01-18",
+          "probability": 0.31,
+          "risk_level": "moderate",
+          "lower_bound": 0.0,
+          "upper_bound": 0.72
+        },
+        ...
+      ],
+      "horizon_probability": 0.87,
+      "expected_suspension_days": 2.1,
+      "n_paths": 5000
+    }
+    """
+    try:
+        city = request.args.get('city', 'Batangas City')
+        days = int(request.args.get('days', 7))
+        requested_paths = int(request.args.get('paths', 5000))
+
+        if days < 1 or requested_paths < 1:
+            return jsonify({
+                'error': 'Invalid parameters',
+                'message': 'days and paths must be positive'
+            }), 400
+
+        if days > MAX_SIMULATION_DAYS:
+            return jsonify({
+                'error': 'Invalid parameters',
+                'message': f'days must be at most {MAX_SIMULATION_DAYS}'
+            }), 400
+
+        paths = next(
+            (n for n in SIMULATION_PATH_SIZES if n >= requested_paths),
+            SIMULATION_PATH_SIZES[-1]
+        )
+
+        cached_data = get_or_train_predictor(city)
+
+        if cached_data is None:
+            return jsonify({
+                'error': 'Failed to train model',
+                'message': 'Unable to generate predictions at this time'
+            }), 500
+
+        simulation = cached_data['predictor'].simulate_suspension_probability(
+            steps=days,
+            n_paths=paths
+        )
+
+        trained_at = last_training_time.get(city)
+
+        forecast = []
+        for item in simulation['forecast']:
+            item = dict(item)
             if isinstance(item['date'], datetime):
                 item['date'] = item['date'].strftime('%Y-%m-%d')
+            forecast.append(item)
 
-        recommendation = result['recommendation']
-        if 'high_risk_days' in recommendation:
-            for day in recommendation['high_risk_days']:
-                if 'date' in day and isinstance(day['date'], datetime):
-                    day['date'] = day['date'].strftime('%Y-%m-%d')
-
-        response = {
+        return jsonify({
             'city': city,
-            'forecast': forecast[:days],  # Limit to requested days
-            'recommendation': recommendation,
-            'accuracy': result.get('accuracy'),
-            'model_info': result.get('model_info'),
+            'forecast': forecast,
+            'horizon_probability': simulation['horizon_probability'],
+            'expected_suspension_days': simulation['expected_suspension_days'],
+            'n_paths': simulation['n_paths'],
+            'trained_at': trained_at.isoformat() if trained_at else None,
             'generated_at': datetime.now().isoformat()
-        }
-
-        return jsonify(response)
+        })
 
+    except TrainingQueueFull as e:
+        return queue_full_response(e)
     except Exception as e:
-        print(f"❌ Error in suspension_forecast: {e}")
+        print(f"❌ Error in suspension_simulation: {e}")
         return jsonify({
             'error': str(e),
-            'message': 'Error generating forecast'
+            'message': 'Error generating simulation'
         }), 500
 
 
@@ -171,8 +536,11 @@ def get_model_info():
     }
     """
     try:
+        with cache_lock:
+            cached_items = list(predictor_cache.items())
+
         models = []
-        for city, cache_data in predictor_cache.items():
+        for city, cache_data in cached_items:
             result = cache_data['result']
             models.append({
                 'city': city,
@@ -185,7 +553,9 @@ def get_model_info():
 
         return jsonify({
             'models': models,
-            'total_models': len(models)
+            'total_models': len(models),
+            'max_cached_models': MAX_CACHED_CITIES,
+            'training_queue': training_queue.stats()
         })
 
     except Exception as e:
@@ -211,7 +581,8 @@ def retrain_model():
         print(f"🔄 Force retraining model for {city}...")
 
         # Force retrain
-        cached_data = get_or_train_predictor(city, force_retrain=True)
+        profiling = profiling_requested()
+        cached_data = get_or_train_predictor(city, force_retrain=True, profile=profiling)
 
         if cached_data is None:
             return jsonify({
@@ -222,10 +593,13 @@ def retrain_model():
         return jsonify({
             'success': True,
             'message': f'Model retrained successfully for {city}',
-            'trained_at': last_training_time[city].isoformat(),
-            'model_info': cached_data['result']['model_info']
+            'trained_at': last_training_time.get(city, datetime.now()).isoformat(),
+            'model_info': cached_data['result']['model_info'],
+            'profile': cached_data.get('training_profile') if profiling else None
         })
 
+    except TrainingQueueFull as e:
+        return queue_full_response(e)
     except Exception as e:
         return jsonify({
             'success': False,
@@ -233,6 +607,50 @@ def retrain_model():
         }), 500
 
 
+@app.route('/api/predictions/profiles', methods=['GET'])
+def get_profiles():
+    """
+    Aggregated profiles over the rolling window
+
+    Headers:
+    - X-Profile-Token: Must match PREDICTION_PROFILING_TOKEN
+
+    Returns:
+    {
+      "window_seconds": 3600,
+      "covered_seconds": {"fits": 3600, "requests": 412.5},
+      "records": 42,
+      "profiled_records": 3,
+      "durations": {"fit": {"count": 5, "mean": 1.2, "p95": 1.9, "max": 2.0}, ...},
+      "stages": {"fit": {...}, "accuracy": {...}, ...},
+      "hot_functions": [
+        {"function": "statsmodels/tsa/...", "ncalls": 120, "tottime": 0.8, "cumtime": 1.1, "profiles": 3},
+        ...
+      ]
+    }
+    """
+    if not PROFILING_TOKEN:
+        return jsonify({
+            'error': 'Profiling is disabled',
+            'message': 'Set PREDICTION_PROFILING_TOKEN to enable profiling'
+        }), 404
+
+    if not profiling_requested():
+        return jsonify({
+            'error': 'Forbidden',
+            'message': 'Missing or invalid X-Profile-Token header'
+        }), 403
+
+    try:
+        limit = int(request.args.get('limit', 20))
+        return jsonify(profile_store.summary(limit=limit))
+
+    except Exception as e:
+        return jsonify({
+            'error': str(e)
+        }), 500
+
+
 @app.route('/api/predictions/test', methods=['GET'])
 def test_prediction():
     """
@@ -269,8 +687,11 @@ if __name__ == '__main__':
     print("\nAvailable Endpoints:")
     print("  GET  /health")
     print("  GET  /api/predictions/suspension-forecast?city=BatangasCity")
+    print("  GET  /api/predictions/province-forecast?province=BATANGAS")
+    print("  GET  /api/predictions/suspension-simulation?city=BatangasCity&paths=5000")
     print("  GET  /api/predictions/model-info")
     print("  POST /api/predictions/retrain")
+    print("  GET  /api/predictions/profiles")
     print("  GET  /api/predictions/test")
     print("\n" + "="*60)
     print("Starting server on http://localhost:5000")
@@ -5,10 +5,14 @@ Predicts the probability of class suspension for the next 7 days
 
 import numpy as np
 import pandas as pd
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from statsmodels.tsa.arima.model import ARIMA
 from sklearn.preprocessing import MinMaxScaler
+import threading
+import time
 import warnings
+from contextlib import contextmanager
 warnings.filterwarnings('ignore')
 
 
@@ -17,10 +21,29 @@ class SuspensionPredictor:
     ARIMA-based suspension probability predictor
     """
 
+    # Simulation results kept per model, least recently used evicted first
+    SIMULATION_CACHE_SIZE = 8
+    # Simulations always cover at least this many days; shorter requests are slices
+    SIMULATION_HORIZON = 30
+
     def __init__(self):
         self.model = None
         self.scaler = MinMaxScaler()
         self.historical_data = None
+        self.simulation_cache = OrderedDict()
+        self.simulation_lock = threading.Lock()
+        self.stage_timings = {}
+
+    @contextmanager
+    def _timed(self, stage):
+        """
+        Record wall-clock seconds spent in a pipeline stage
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage_timings[stage] = time.perf_counter() - start
 
     def generate_sample_data(self, days=90):
         """
@@ -102,6 +125,8 @@ class SuspensionPredictor:
             # Train ARIMA model
             model = ARIMA(train_data, order=order)
             self.model = model.fit()
+            with self.simulation_lock:
+                self.simulation_cache.clear()  # Simulations belong to the previous fit
 
             print(f"[OK] Model trained successfully")
             print(f"   AIC: {self.model.aic:.2f}")
@@ -166,6 +191,123 @@ class SuspensionPredictor:
             print(f"[ERROR] Error generating forecast: {e}")
             return None
 
+    def _simulate_paths(self, steps, n_paths, rng):
+        """
+        Simulate future values of the fitted model for all paths at once
+
+        Steps the model's state-space form (which includes the differencing)
+        one day at a time across an (n_states, n_paths) state array, instead
+        of statsmodels' simulate(), which loops over repetitions in Python.
+
+        Returns an array of shape (steps, n_paths)
+        """
+        ssm = self.model.model.ssm
+        Z = ssm['design']            # (1, k)
+        d = ssm['obs_intercept']     # (1,)
+        H = ssm['obs_cov']           # (1, 1)
+        T = ssm['transition']        # (k, k)
+        c = ssm['state_intercept']   # (k,)
+        R = ssm['selection']         # (k, r)
+        Q = ssm['state_cov']         # (r, r)
+
+        # Start from the one-step-ahead predicted state after the last observation
+        mean = self.model.predicted_state[:, -1]
+        cov = self.model.predicted_state_cov[:, :, -1]
+        eigvals, eigvecs = np.linalg.eigh(cov)
+        cov_root = eigvecs * np.sqrt(np.clip(eigvals, 0, None))
+        state = mean[:, None] + cov_root @ rng.standard_normal((len(mean), n_paths))
+
+        # All innovations drawn up front, scaled by sigma2 (Q)
+        state_shocks = np.linalg.cholesky(Q) @ rng.standard_normal((steps, Q.shape[0], n_paths))
+        obs_shocks = np.sqrt(H[0, 0]) * rng.standard_normal((steps, n_paths)) if H[0, 0] > 0 else None
+
+        paths = np.empty((steps, n_paths))
+        for t in range(steps):
+            paths[t] = Z @ state + d
+            if obs_shocks is not None:
+                paths[t] += obs_shocks[t]
+            state = T @ state + c[:, None] + R @ state_shocks[t]
+
+        return paths
+
+    def simulate_suspension_probability(self, steps=7, n_paths=5000, seed=None):
+        """
+        Monte Carlo estimate of daily suspension probabilities
+
+        Draws n_paths future trajectories of the 7-day suspension rate from
+        the fitted model as one batched array, then samples a suspension
+        (yes/no) for every day of every path at that day's simulated rate.
+
+        Returns:
+        - forecast: Per-day probability with 5th-95th percentile of the rate
+        - horizon_probability: Chance of at least one suspension within `steps` days
+        - expected_suspension_days: Mean number of suspension days within `steps` days
+
+        Paths are simulated over max(steps, SIMULATION_HORIZON) days and the
+        per-day summaries cached per (horizon, n_paths, seed), so requests for
+        any shorter horizon are served from the same entry. The last
+        SIMULATION_CACHE_SIZE entries are kept until the model is retrained.
+        """
+        if self.model is None:
+            raise ValueError("Model not trained. Call train_model() first.")
+
+        horizon = max(steps, self.SIMULATION_HORIZON)
+        cache_key = (horizon, n_paths, seed)
+        with self.simulation_lock:
+            summary = self.simulation_cache.get(cache_key)
+            if summary is not None:
+                self.simulation_cache.move_to_end(cache_key)
+
+        if summary is None:
+            summary = self._summarize_simulation(horizon, n_paths, seed)
+            with self.simulation_lock:
+                self.simulation_cache[cache_key] = summary
+                self.simulation_cache.move_to_end(cache_key)
+                while len(self.simulation_cache) > self.SIMULATION_CACHE_SIZE:
+                    self.simulation_cache.popitem(last=False)
+
+        forecast = summary['daily'].iloc[:steps].copy()
+        forecast['risk_level'] = forecast['probability'].apply(self._classify_risk)
+
+        return {
+            'forecast': forecast.to_dict('records'),
+            'horizon_probability': float(summary['any_suspension'][steps - 1]),
+            'expected_suspension_days': float(summary['expected_days'][steps - 1]),
+            'n_paths': n_paths
+        }
+
+    def _summarize_simulation(self, horizon, n_paths, seed):
+        """
+        Simulate `horizon` days and reduce the paths to per-day summaries
+        """
+        rng = np.random.default_rng(seed)
+        rates = np.clip(self._simulate_paths(horizon, n_paths, rng), 0, 1)
+
+        # Sample daily suspension outcomes for all paths at once
+        suspended = rng.random(rates.shape) < rates
+
+        daily_probability = suspended.mean(axis=1)
+        rate_lower, rate_upper = np.percentile(rates, [5, 95], axis=1)
+
+        last_date = self.historical_data.index[-1]
+        future_dates = pd.date_range(
+            start=last_date + timedelta(days=1),
+            periods=horizon,
+            freq='D'
+        )
+
+        return {
+            'daily': pd.DataFrame({
+                'date': future_dates,
+                'probability': daily_probability,
+                'lower_bound': rate_lower,
+                'upper_bound': rate_upper
+            }),
+            # Entry t covers days 0..t
+            'any_suspension': np.logical_or.accumulate(suspended, axis=0).mean(axis=1),
+            'expected_days': np.cumsum(daily_probability)
+        }
+
     def _classify_risk(self, probability):
         """
         Classify risk level based on probability
@@ -260,7 +402,10 @@ class SuspensionPredictor:
     def run_full_pipeline(self, city='Batangas City', days=90, forecast_steps=7):
         """
         Complete pipeline: fetch data -> train model -> generate forecast
+        Seconds spent in each step are recorded in self.stage_timings
         """
+        self.stage_timings = {}
+
         print(f"\n>> Starting ARIMA Suspension Prediction Pipeline")
         print(f"   City: {city}")
         print(f"   Training data: {days} days")
@@ -268,37 +413,43 @@ class SuspensionPredictor:
 
         # Step 1: Fetch data
         print("[*] Fetching historical data...")
-        df = self.fetch_historical_data(city, days)
+        with self._timed('fetch'):
+            df = self.fetch_historical_data(city, days)
         print(f"   [OK] Loaded {len(df)} days of data")
 
         # Step 2: Preprocess
         print("\n[*] Preprocessing data...")
-        df = self.preprocess_data(df)
+        with self._timed('preprocess'):
+            df = self.preprocess_data(df)
         self.historical_data = df
         print(f"   [OK] Data prepared")
 
         # Step 3: Train model
         print("\n[*] Training ARIMA model...")
-        success = self.train_model(df)
+        with self._timed('fit'):
+            success = self.train_model(df)
         if not success:
             return None
 
         # Step 4: Generate forecast
         print(f"\n[*] Generating {forecast_steps}-day forecast...")
-        forecast = self.predict_suspension_probability(forecast_steps)
+        with self._timed('forecast'):
+            forecast = self.predict_suspension_probability(forecast_steps)
         if forecast is None:
             return None
         print(f"   [OK] Forecast generated")
 
         # Step 5: Get recommendation
         print("\n[*] Generating recommendation...")
-        recommendation = self.get_recommendation(forecast)
+        with self._timed('recommendation'):
+            recommendation = self.get_recommendation(forecast)
         print(f"   Action: {recommendation['action']}")
         print(f"   Message: {recommendation['message']}")
 
         # Step 6: Calculate accuracy
         print("\n[*] Calculating model accuracy...")
-        accuracy_metrics = self.calculate_accuracy(df)
+        with self._timed('accuracy'):
+            accuracy_metrics = self.calculate_accuracy(df)
         if accuracy_metrics:
             print(f"   Accuracy: {accuracy_metrics['accuracy']*100:.1f}%")
 
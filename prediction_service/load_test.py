@@ -0,0 +1,338 @@
+"""
+Load test for the ARIMA prediction API
+Starts the Flask app in-process (or targets a running server) and drives
+concurrent mixed traffic, then reports throughput, latency percentiles,
+error rates and CPU/memory over time
+
+Usage:
+    python load_test.py --duration 30 --concurrency 16
+    python load_test.py --url http://localhost:5000 --pid 12345 --json run.json
+"""
+
+import argparse
+import contextlib
+import itertools
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+DEFAULT_MIX = 'cache=70,cold=10,retrain=5,info=15'
+
+
+class ResourceMonitor:
+    """
+    Samples CPU and resident memory of a process once per interval
+    Reads /proc on Linux. Without /proc only this process can be monitored,
+    via os.times, and memory is peak rather than current RSS.
+
+    Raises ValueError if an explicit pid cannot be monitored
+    """
+
+    def __init__(self, pid=None, interval=1.0):
+        if pid is not None and not os.path.exists(f'/proc/{pid}'):
+            if os.path.exists('/proc'):
+                raise ValueError(f"No process with pid {pid}")
+            raise ValueError("--pid needs /proc (Linux); run the load test in-process instead")
+
+        self.pid = pid or os.getpid()
+        self.interval = interval
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._page_size = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+        self._ticks = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+    def _read(self):
+        """
+        Return (cpu_seconds, rss_bytes) for the monitored process
+        """
+        proc = f'/proc/{self.pid}'
+        if os.path.exists(proc):
+            with open(f'{proc}/stat') as f:
+                # Fields after the parenthesised command name; utime/stime are 14/15
+                fields = f.read().rsplit(')', 1)[1].split()
+            cpu = (int(fields[11]) + int(fields[12])) / self._ticks
+            with open(f'{proc}/statm') as f:
+                rss = int(f.read().split()[1]) * self._page_size
+            return cpu, rss
+
+        times = os.times()
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 if resource else 0
+        return times.user + times.system, rss
+
+    def _run(self):
+        start = time.monotonic()
+        last_cpu = self._read()[0]
+        last_time = start
+        while not self._stop.wait(self.interval):
+            cpu, rss = self._read()
+            now = time.monotonic()
+            self.samples.append({
+                't': round(now - start, 2),
+                'cpu_percent': round(100 * (cpu - last_cpu) / (now - last_time), 1),
+                'rss_mb': round(rss / 2**20, 1)
+            })
+            last_cpu, last_time = cpu, now
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+def parse_mix(spec):
+    """
+    Parse 'cache=70,cold=10,...' into {scenario: weight}
+    """
+    mix = {}
+    for part in spec.split(','):
+        name, weight = part.split('=')
+        if name not in SCENARIOS:
+            raise ValueError(f"Unknown scenario '{name}' (choose from {', '.join(SCENARIOS)})")
+        mix[name] = float(weight)
+    return mix
+
+
+def _forecast(session, base_url, city):
+    return session.get(
+        f'{base_url}/api/predictions/suspension-forecast',
+        params={'city': city, 'days': 7},
+        timeout=120
+    )
+
+
+def scenario_cache(session, base_url, ctx, rng):
+    """Forecast for a city that was trained during warm-up"""
+    return _forecast(session, base_url, rng.choice(ctx['warm_cities']))
+
+
+def scenario_cold(session, base_url, ctx, rng):
+    """Forecast for a city that has never been requested"""
+    return _forecast(session, base_url, f"Load Test City {next(ctx['cold_counter'])}")
+
+
+def scenario_retrain(session, base_url, ctx, rng):
+    """Forced retrain of a warm city"""
+    return session.post(
+        f'{base_url}/api/predictions/retrain',
+        json={'city': rng.choice(ctx['warm_cities'])},
+        timeout=120
+    )
+
+
+def scenario_info(session, base_url, ctx, rng):
+    """Model info listing"""
+    return session.get(f'{base_url}/api/predictions/model-info', timeout=30)
+
+
+SCENARIOS = {
+    'cache': scenario_cache,
+    'cold': scenario_cold,
+    'retrain': scenario_retrain,
+    'info': scenario_info
+}
+
+
+def start_local_server():
+    """
+    Serve app.py on a free localhost port in a background thread
+    Returns (base_url, server)
+    """
+    from werkzeug.serving import make_server
+    from app import app
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_port}', server
+
+
+def run_worker(worker_id, base_url, ctx, mix, deadline, seed):
+    """
+    Issue requests until the deadline, recording one result per request
+    """
+    rng = random.Random(seed + worker_id)
+    names, weights = list(mix), list(mix.values())
+    results = []
+
+    with requests.Session() as session:
+        while time.monotonic() < deadline:
+            name = rng.choices(names, weights)[0]
+            start = time.perf_counter()
+            try:
+                status = SCENARIOS[name](session, base_url, ctx, rng).status_code
+            except requests.RequestException:
+                status = None
+            results.append({
+                'scenario': name,
+                'status': status,
+                'seconds': time.perf_counter() - start
+            })
+
+    return results
+
+
+def summarize(results, elapsed):
+    """
+    Aggregate request results overall and per scenario
+    """
+    def stats(rows):
+        if not rows:
+            return {'requests': 0}
+        latencies = np.array([r['seconds'] for r in rows]) * 1000
+        p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+        ok = sum(1 for r in rows if r['status'] is not None and r['status'] < 400)
+        rejected = sum(1 for r in rows if r['status'] == 429)
+        return {
+            'requests': len(rows),
+            'throughput_rps': round(len(rows) / elapsed, 2),
+            'ok': ok,
+            'rejected_429': rejected,
+            'error_rate': round((len(rows) - ok - rejected) / len(rows), 4),
+            'latency_ms': {
+                'mean': round(float(latencies.mean()), 1),
+                'p50': round(float(p50), 1),
+                'p90': round(float(p90), 1),
+                'p99': round(float(p99), 1),
+                'max': round(float(latencies.max()), 1)
+            }
+        }
+
+    by_scenario = {}
+    for r in results:
+        by_scenario.setdefault(r['scenario'], []).append(r)
+
+    return {
+        'overall': stats(results),
+        'scenarios': {name: stats(rows) for name, rows in sorted(by_scenario.items())}
+    }
+
+
+def print_report(report):
+    print("\n" + "="*72)
+    print(">> LOAD TEST RESULTS")
+    print("="*72)
+    cfg = report['config']
+    print(f"   Target: {cfg['url']}  Duration: {report['elapsed_seconds']:.1f}s  "
+          f"Concurrency: {cfg['concurrency']}  Mix: {cfg['mix']}")
+
+    header = f"\n   {'scenario':<10}{'reqs':>7}{'rps':>8}{'429':>6}{'err%':>7}" \
+             f"{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}  (ms)"
+    print(header)
+    rows = [('overall', report['summary']['overall'])] + list(report['summary']['scenarios'].items())
+    for name, s in rows:
+        if not s['requests']:
+            continue
+        lat = s['latency_ms']
+        print(f"   {name:<10}{s['requests']:>7}{s['throughput_rps']:>8}{s['rejected_429']:>6}"
+              f"{s['error_rate']*100:>7.1f}{lat['p50']:>9}{lat['p90']:>9}{lat['p99']:>9}{lat['max']:>9}")
+
+    samples = report['resources']
+    if samples:
+        cpu = [s['cpu_percent'] for s in samples]
+        rss = [s['rss_mb'] for s in samples]
+        print(f"\n   CPU: mean {np.mean(cpu):.0f}%  peak {max(cpu):.0f}%   "
+              f"RSS: start {rss[0]:.0f} MB  peak {max(rss):.0f} MB  end {rss[-1]:.0f} MB")
+    print("="*72)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='Target a running server instead of starting app.py in-process')
+    parser.add_argument('--pid', type=int, help='Process to monitor when using --url (default: this process)')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds of load (default: 30)')
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent clients (default: 8)')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f'Scenario weights (default: {DEFAULT_MIX})')
+    parser.add_argument('--warm-cities', type=int, default=5, help='Cities trained before the run (default: 5)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for traffic selection')
+    parser.add_argument('--json', help='Write the full report (including resource timeline) to this file')
+    parser.add_argument('--verbose', action='store_true', help='Show server output during the run')
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    server = None
+
+    try:
+        monitor = ResourceMonitor(pid=args.pid if args.url else None)
+    except ValueError as e:
+        parser.error(str(e))
+
+    with contextlib.ExitStack() as stack:
+        # Discard server output rather than buffering it, so it does not show up as RSS growth
+        if not args.verbose:
+            devnull = stack.enter_context(open(os.devnull, 'w'))
+            stack.enter_context(contextlib.redirect_stdout(devnull))
+
+        if args.url:
+            base_url = args.url.rstrip('/')
+        else:
+            base_url, server = start_local_server()
+
+        ctx = {
+            'warm_cities': [f'Load Test Warm {i}' for i in range(args.warm_cities)],
+            'cold_counter': itertools.count()
+        }
+        for city in ctx['warm_cities']:
+            requests.get(
+                f'{base_url}/api/predictions/suspension-forecast',
+                params={'city': city},
+                timeout=120
+            ).raise_for_status()
+
+        monitor.start()
+
+        start = time.monotonic()
+        deadline = start + args.duration
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            futures = [
+                pool.submit(run_worker, i, base_url, ctx, mix, deadline, args.seed)
+                for i in range(args.concurrency)
+            ]
+            results = [r for f in futures for r in f.result()]
+        elapsed = time.monotonic() - start
+
+        monitor.stop()
+        if server is not None:
+            server.shutdown()
+
+    report = {
+        'config': {
+            'url': args.url or 'in-process',
+            'duration': args.duration,
+            'concurrency': args.concurrency,
+            'mix': args.mix,
+            'warm_cities': args.warm_cities,
+            'seed': args.seed
+        },
+        'elapsed_seconds': elapsed,
+        'summary': summarize(results, elapsed),
+        'resources': monitor.samples
+    }
+
+    print_report(report)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n[OK] Report written to {args.json}")
+
+    return 0 if report['summary']['overall'].get('error_rate', 1) == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,73 @@
+"""
+Province and Region Lookup for Philippine Municipalities
+Reads AllLocationsPossible.json from the repository root
+"""
+
+import json
+import os
+from functools import lru_cache
+
+LOCATIONS_FILE = os.environ.get(
+    'PREDICTION_LOCATIONS_FILE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'AllLocationsPossible.json')
+)
+
+
+@lru_cache(maxsize=1)
+def load_location_index():
+    """
+    Load municipality names grouped by region and province
+    Barangay lists are dropped to keep the index small
+
+    Returns:
+    {
+      "4A": {
+        "region_name": "REGION IV-A",
+        "provinces": {"BATANGAS": ["AGONCILLO", ...], ...}
+      },
+      ...
+    }
+    """
+    with open(LOCATIONS_FILE, encoding='utf-8') as f:
+        raw = json.load(f)
+
+    index = {}
+    for region_code, region in raw.items():
+        index[region_code] = {
+            'region_name': region['region_name'],
+            'provinces': {
+                province: list(data['municipality_list'].keys())
+                for province, data in region['province_list'].items()
+            }
+        }
+    return index
+
+
+def get_municipalities(province=None, region=None):
+    """
+    List (province, municipality) pairs for a province or a region
+
+    Names are matched case-insensitively; a region may be given by its code
+    ("4A") or its name ("REGION IV-A"). Returns None if nothing matches.
+    """
+    index = load_location_index()
+
+    if province:
+        wanted = province.strip().upper()
+        for region_data in index.values():
+            if wanted in region_data['provinces']:
+                return [(wanted, m) for m in region_data['provinces'][wanted]]
+        return None
+
+    if region:
+        wanted = region.strip().upper()
+        for region_code, region_data in index.items():
+            if wanted in (region_code.upper(), region_data['region_name'].upper()):
+                return [
+                    (name, m)
+                    for name, municipalities in region_data['provinces'].items()
+                    for m in municipalities
+                ]
+        return None
+
+    return None
@@ -0,0 +1,191 @@
+"""
+On-Demand Profiling for the Prediction Pipeline
+Runs code under cProfile and aggregates stage timings and hot functions
+over a rolling time window
+"""
+
+import cProfile
+import os
+import pstats
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+
+def _function_label(func):
+    """
+    Turn a pstats (filename, lineno, name) key into a short readable label
+    """
+    filename, lineno, name = func
+    if filename == '~':
+        return name  # Built-in function
+
+    marker = 'site-packages' + os.sep
+    if marker in filename:
+        filename = filename.split(marker, 1)[1]
+    else:
+        filename = os.path.basename(filename)
+    return f"{filename}:{lineno}({name})"
+
+
+def top_functions(profiler, limit=20):
+    """
+    Extract the hottest functions from a finished cProfile.Profile
+
+    Returns the union of the top `limit` by self time and by cumulative time
+    """
+    stats = pstats.Stats(profiler).stats
+    rows = [
+        {
+            'function': _function_label(func),
+            'ncalls': ncalls,
+            'tottime': tottime,
+            'cumtime': cumtime
+        }
+        for func, (_, ncalls, tottime, cumtime, _) in stats.items()
+    ]
+
+    by_self = sorted(rows, key=lambda r: r['tottime'], reverse=True)[:limit]
+    by_cumulative = sorted(rows, key=lambda r: r['cumtime'], reverse=True)[:limit]
+
+    top = {r['function']: r for r in by_self + by_cumulative}
+    return sorted(top.values(), key=lambda r: r['tottime'], reverse=True)
+
+
+# Only one cProfile session runs at a time; overlapping requests are timed only
+_profiler_lock = threading.Lock()
+
+
+@contextmanager
+def profile_block(limit=20):
+    """
+    Profile the enclosed block in the current thread
+
+    Usage:
+        with profile_block() as run:
+            do_work()
+        run['seconds'], run['functions']
+
+    run['functions'] stays None if another profile was already running
+    """
+    run = {'seconds': None, 'functions': None}
+    profiler = cProfile.Profile() if _profiler_lock.acquire(blocking=False) else None
+    start = time.perf_counter()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield run
+    finally:
+        run['seconds'] = time.perf_counter() - start
+        if profiler is not None:
+            profiler.disable()
+            _profiler_lock.release()
+            run['functions'] = top_functions(profiler, limit)
+
+
+class ProfileStore:
+    """
+    Rolling window of profile records
+
+    Every record has a kind ('fit' or a request name), a total duration and
+    optionally per-stage timings and hot functions from cProfile.
+
+    Records with stages or functions (fits) and plain request timings are
+    kept in separate bounded deques, so heavy request traffic cannot push
+    fit profiles out. If a deque fills up before the window elapses, the
+    summary reports the shorter span it actually covers.
+    """
+
+    def __init__(self, window_seconds=3600, max_records=500, max_request_records=5000):
+        self.window_seconds = window_seconds
+        self._fits = deque(maxlen=max_records)
+        self._requests = deque(maxlen=max_request_records)
+        self._lock = threading.Lock()
+
+    def _prune(self, now):
+        for records in (self._fits, self._requests):
+            while records and now - records[0]['recorded_at'] > self.window_seconds:
+                records.popleft()
+
+    def _covered_seconds(self, records, now):
+        if not records:
+            return 0.0
+        return min(now - records[0]['recorded_at'], self.window_seconds)
+
+    def record(self, kind, city, seconds, stages=None, functions=None):
+        now = time.time()
+        records = self._fits if stages or functions is not None else self._requests
+        with self._lock:
+            records.append({
+                'recorded_at': now,
+                'kind': kind,
+                'city': city,
+                'seconds': seconds,
+                'stages': stages or {},
+                'functions': functions
+            })
+            self._prune(now)
+
+    def summary(self, limit=20):
+        """
+        Aggregate the window into per-kind and per-stage latency stats
+        and the functions with the most total self time
+        """
+        now = time.time()
+        with self._lock:
+            self._prune(now)
+            records = list(self._fits) + list(self._requests)
+            covered = {
+                'fits': self._covered_seconds(self._fits, now),
+                'requests': self._covered_seconds(self._requests, now)
+            }
+
+        def describe(values):
+            values = np.asarray(values)
+            return {
+                'count': int(len(values)),
+                'mean': float(values.mean()),
+                'p95': float(np.percentile(values, 95)),
+                'max': float(values.max())
+            }
+
+        durations = {}
+        stages = {}
+        functions = {}
+        profiled = 0
+
+        for rec in records:
+            durations.setdefault(rec['kind'], []).append(rec['seconds'])
+            for stage, seconds in rec['stages'].items():
+                stages.setdefault(stage, []).append(seconds)
+
+            if rec['functions'] is None:
+                continue
+            profiled += 1
+            for row in rec['functions']:
+                agg = functions.setdefault(row['function'], {
+                    'function': row['function'],
+                    'ncalls': 0,
+                    'tottime': 0.0,
+                    'cumtime': 0.0,
+                    'profiles': 0
+                })
+                agg['ncalls'] += row['ncalls']
+                agg['tottime'] += row['tottime']
+                agg['cumtime'] += row['cumtime']
+                agg['profiles'] += 1
+
+        hot = sorted(functions.values(), key=lambda r: r['tottime'], reverse=True)[:limit]
+
+        return {
+            'window_seconds': self.window_seconds,
+            'covered_seconds': covered,
+            'records': len(records),
+            'profiled_records': profiled,
+            'durations': {kind: describe(v) for kind, v in durations.items()},
+            'stages': {stage: describe(v) for stage, v in stages.items()},
+            'hot_functions': hot
+        }
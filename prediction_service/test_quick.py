@@ -4,8 +4,10 @@ Run this to verify everything is working
 """
 
 import sys
+import threading
 import requests
 from arima_model import SuspensionPredictor
+from training_queue import TrainingQueue
 
 def test_model():
     """Test the ARIMA model locally"""
@@ -35,10 +37,75 @@ def test_model():
         return False
 
 
+def test_admission_control():
+    """Test the training queue and LRU cache in-process (no server needed)"""
+    print("\n" + "="*60)
+    print("🧪 TEST 2: Admission Control")
+    print("="*60)
+
+    import app as app_module
+
+    saved = (app_module.training_queue, app_module.MAX_CACHED_CITIES)
+    release = threading.Event()
+
+    try:
+        app_module.predictor_cache.clear()
+        app_module.last_training_time.clear()
+        app_module.training_queue = TrainingQueue(max_concurrent=1, max_pending=0)
+        app_module.MAX_CACHED_CITIES = 2
+        client = app_module.app.test_client()
+
+        # Dedup: the same key returns the same job while it is in flight
+        print("\n📡 Testing per-city deduplication...")
+        blocker = app_module.training_queue.submit('Blocker', release.wait)
+        if app_module.training_queue.submit('Blocker', release.wait) is not blocker:
+            print("   ❌ Duplicate submit started a second job")
+            return False
+        print("   ✅ Duplicate submit shared the running job")
+
+        # Backpressure: a different city is rejected while the only slot is busy
+        print("\n📡 Testing 429 when the queue is full...")
+        response = client.get('/api/predictions/suspension-forecast', query_string={'city': 'Queue City'})
+        if response.status_code != 429 or int(response.headers.get('Retry-After', 0)) < 1:
+            print(f"   ❌ Expected 429 with Retry-After, got {response.status_code}")
+            return False
+        print(f"   ✅ Got 429, Retry-After: {response.headers['Retry-After']}s")
+
+        release.set()
+        blocker.result()
+
+        # LRU: touching City A keeps it, so City B is evicted when City C arrives
+        print("\n📡 Testing LRU eviction...")
+        for city in ['City A', 'City B', 'City A', 'City C']:
+            response = client.get('/api/predictions/suspension-forecast', query_string={'city': city, 'days': 3})
+            if response.status_code != 200:
+                print(f"   ❌ Forecast for {city} failed: {response.status_code}")
+                return False
+
+        cached = list(app_module.predictor_cache.keys())
+        if cached != ['City A', 'City C'] or 'City B' in app_module.last_training_time:
+            print(f"   ❌ Unexpected cache contents: {cached}")
+            return False
+        print(f"   ✅ Least recently used city evicted, cached: {cached}")
+
+        print("\n✅ Admission control test PASSED")
+        return True
+
+    except Exception as e:
+        print(f"\n❌ Admission control test FAILED: {e}")
+        return False
+
+    finally:
+        release.set()
+        app_module.training_queue, app_module.MAX_CACHED_CITIES = saved
+        app_module.predictor_cache.clear()
+        app_module.last_training_time.clear()
+
+
 def test_api():
     """Test the Flask API"""
     print("\n" + "="*60)
-    print("🧪 TEST 2: Flask API")
+    print("🧪 TEST 3: Flask API")
     print("="*60)
 
     try:
@@ -87,7 +154,10 @@ def main():
     # Test 1: Model
     model_ok = test_model()
 
-    # Test 2: API (only if model works)
+    # Test 2: Admission control (in-process)
+    admission_ok = test_admission_control() if model_ok else False
+
+    # Test 3: API (only if model works)
     if model_ok:
         print("\n⏳ Waiting for you to start Flask server...")
         print("   Run in another terminal: python app.py")
@@ -102,11 +172,12 @@ def main():
     print("\n" + "="*60)
     print("📊 TEST SUMMARY")
     print("="*60)
-    print(f"   Model Test: {'✅ PASS' if model_ok else '❌ FAIL'}")
-    print(f"   API Test:   {'✅ PASS' if api_ok else '❌ FAIL'}")
+    print(f"   Model Test:     {'✅ PASS' if model_ok else '❌ FAIL'}")
+    print(f"   Admission Test: {'✅ PASS' if admission_ok else '❌ FAIL'}")
+    print(f"   API Test:       {'✅ PASS' if api_ok else '❌ FAIL'}")
     print("="*60)
 
-    if model_ok and api_ok:
+    if model_ok and admission_ok and api_ok:
         print("\n🎉 All tests passed! System is ready to use.")
         print("\nNext steps:")
         print("1. Keep Flask server running (python app.py)")
@@ -0,0 +1,107 @@
+"""
+Bounded Training Queue for ARIMA Model Fits
+Deduplicates concurrent training requests per city and limits parallel fits
+"""
+
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class TrainingQueueFull(Exception):
+    """
+    Raised when the queue cannot admit another training job
+    """
+
+    def __init__(self, retry_after):
+        super().__init__('Training queue is full')
+        self.retry_after = retry_after
+
+
+class TrainingQueue:
+    """
+    Runs training jobs on a fixed pool of worker threads
+
+    - Jobs are keyed (by city); submitting a key that is already queued or
+      running returns the existing job instead of starting another fit
+    - At most max_concurrent fits run at once and at most max_pending wait
+      behind them; anything beyond that raises TrainingQueueFull
+    """
+
+    def __init__(self, max_concurrent=2, max_pending=8, default_fit_seconds=5.0):
+        self.max_concurrent = max_concurrent
+        self.max_pending = max_pending
+        self.default_fit_seconds = default_fit_seconds
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_concurrent,
+            thread_name_prefix='arima-fit'
+        )
+        # Re-entrant because done callbacks may fire while submit() holds it
+        self._lock = threading.RLock()
+        self._jobs = {}
+        self._running = 0
+        self._avg_fit_seconds = None
+
+    def submit(self, key, fn, *args, **kwargs):
+        """
+        Queue fn(*args, **kwargs) under key and return its Future
+        """
+        with self._lock:
+            future = self._jobs.get(key)
+            if future is not None:
+                return future
+
+            if len(self._jobs) >= self.max_concurrent + self.max_pending:
+                raise TrainingQueueFull(self.estimate_retry_after())
+
+            future = self._executor.submit(self._run, fn, args, kwargs)
+            self._jobs[key] = future
+            future.add_done_callback(lambda f: self._release(key, f))
+            return future
+
+    def _run(self, fn, args, kwargs):
+        with self._lock:
+            self._running += 1
+
+        start = time.monotonic()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            elapsed = time.monotonic() - start
+            with self._lock:
+                self._running -= 1
+                # Exponential moving average of fit duration
+                if self._avg_fit_seconds is None:
+                    self._avg_fit_seconds = elapsed
+                else:
+                    self._avg_fit_seconds = 0.8 * self._avg_fit_seconds + 0.2 * elapsed
+
+    def _release(self, key, future):
+        with self._lock:
+            if self._jobs.get(key) is future:
+                del self._jobs[key]
+
+    def estimate_retry_after(self):
+        """
+        Estimate seconds until a queue slot frees up
+        """
+        with self._lock:
+            avg = self._avg_fit_seconds or self.default_fit_seconds
+            waves = max(1, math.ceil(len(self._jobs) / self.max_concurrent))
+            return max(1, math.ceil(avg * waves))
+
+    def stats(self):
+        """
+        Snapshot of queue state for monitoring
+        """
+        with self._lock:
+            return {
+                'running': self._running,
+                'pending': len(self._jobs) - self._running,
+                'max_concurrent': self.max_concurrent,
+                'max_pending': self.max_pending,
+                'avg_fit_seconds': round(self._avg_fit_seconds, 3) if self._avg_fit_seconds else None,
+                'in_flight': list(self._jobs.keys())
+            }